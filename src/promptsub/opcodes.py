@@ -0,0 +1,16 @@
+"""
+Instructions of a compiled Template program. Each instruction is a tuple
+which starts with one of the opcodes below:
+
+(LITERAL, text)                         - append the text as is
+(VAR, key)                              - append the value of a Variable
+(MUTE, key)                             - only check that Variable has value
+(EQ, key, required_value, muted)        - check that value is the required one
+(TEMPLATE, template)                    - append the substituted Template
+"""
+
+LITERAL = 0
+VAR = 1
+MUTE = 2
+EQ = 3
+TEMPLATE = 4
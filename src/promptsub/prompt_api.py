@@ -1,5 +1,5 @@
 from __future__ import annotations
-from functools import cached_property
+from functools import cached_property, lru_cache
 
 from attrs import (
     Factory,
@@ -17,6 +17,14 @@ from promptsub.types import (
 )
 
 
+_STR_TYPE = frozenset((str,))
+
+# Parsed templates are kept alive by the cache together with their
+# generated code, so only a few short texts are cached
+_PARSE_CACHE_SIZE = 128
+_MAX_CACHED_TEXT_LENGTH = 1000
+
+
 def _init_template(self: Prompt) -> Template:
     """
     Manual type check because `attrs.validators` is a bit broken:
@@ -28,7 +36,9 @@ def _init_template(self: Prompt) -> Template:
         err_message = "Template text must be a string"
         raise TypeError(err_message)
 
-    return Template(input_text=self.template_text)
+    if len(self.template_text) > _MAX_CACHED_TEXT_LENGTH:
+        return Template(input_text=self.template_text)
+    return _parse_template(self.template_text)
 
 
 @frozen
@@ -51,9 +61,11 @@ class Prompt:
 
     template_text: str = field(validator=validators.instance_of(str))
 
+    # Not compared, so that Prompts are hashed and compared by their text
     _template: Template = field(
         init=False,
         repr=False,
+        eq=False,
         default=Factory(_init_template, takes_self=True)
     )
 
@@ -76,13 +88,25 @@ class Prompt:
 
         return result
 
+    @staticmethod
+    def cache_clear() -> None:
+        """
+        Drop the cached parsed templates shared by the prompts.
+
+        Up to 128 templates of at most 1000 characters are cached, so that
+        repeated `Prompt(text)` calls skip the parsing. Each one is kept in
+        memory with its generated code until it is pushed out by newer
+        ones or the cache is cleared. Longer texts are parsed every time.
+        """
+        _parse_template.cache_clear()
+
     @cached_property
     def variables(self) -> list[RequiredAndOptionalVariables]:
         """
         Get the names (keys) of all Variables used in a Template.
 
         Returns list of NamedTuples. Each NamedTuple has attributes
-        `required` and `optional`, which are sets of strings.
+        `required` and `optional`, which are frozensets of strings.
 
         A prompt template might consist of multiple alternatives (options)
         divided by separators "|":
@@ -108,27 +132,49 @@ class Prompt:
             (required={'var_1'}, optional={'var_3', 'var_2'})
         ]
         """
-        return self._template.variable_keys
+        return list(self._template.variable_keys)
+
+
+@lru_cache(maxsize=_PARSE_CACHE_SIZE)
+def _parse_template(template_text: str) -> Template:
+    """
+    Templates don't change after parsing, so Prompts created with the same
+    short text share one, see `Prompt.cache_clear`.
+    """
+    return Template(input_text=template_text)
 
 
 def _validate_params(params: dict) -> ValidatedParams:
     """
     Check that the keys are str and the values are str, int or float.
     Convert the values to str.
+
+    The input dict is never changed: if any value needs a conversion,
+    a copy is returned.
     """
+    # Fast path for the most common case, the types are collected in C
+    if {*map(type, params), *map(type, params.values())} <= _STR_TYPE:
+        return params
+
+    validated_params = None
+
     for key, value in params.items():
 
         if not isinstance(key, str):
             err_message = f"Key {key} is not a string"
             raise ParametersTypeError(err_message)
 
-        match value:
-            case str():
-                pass
-            case int() | float():
-                params[key] = str(value)
-            case _:
-                err_message = f"Key {key} has a non-string value"
-                raise ParametersTypeError(err_message)
+        if isinstance(value, str):
+            continue
+
+        if not isinstance(value, (int, float)):
+            err_message = f"Key {key} has a non-string value"
+            raise ParametersTypeError(err_message)
+
+        if validated_params is None:
+            validated_params = dict(params)
+        validated_params[key] = str(value)
 
-    return params
+    if validated_params is None:
+        return params
+    return validated_params
@@ -0,0 +1,188 @@
+"""
+Generates a specialized Python function from the compiled programs of a
+Template and all its alternatives (see `promptsub.opcodes`).
+
+For a Template "Hello {name}[ and {~x} you] | Hi" the generated code is:
+
+def substitute(params):
+    get = params.get
+    if (v0 := get('name')):
+        return ''.join(('Hello ', v0, (' and  you' if get('x') else ''), ' '))
+    return ' Hi'
+
+The whitespaces around separators and muted Variables are kept as is,
+`Prompt.substitute` reduces them afterwards.
+
+Nested Templates are inlined as conditional expressions, so usually the
+whole Prompt is substituted by a single call. The Templates nested deeper
+than `_MAX_INLINE_DEPTH` or having more than `_MAX_INLINE_OPTIONS`
+alternatives are called through their `Template.substitute` instead, so
+that their own functions are generated on the first call, and not
+recursively with the parent's one.
+
+The nested Templates that don't depend on params (e.g. "[Just text]")
+are folded into the neighbouring literals at generation time.
+"""
+from itertools import count
+from typing import Callable
+
+from promptsub import opcodes as op
+from promptsub.errors import InternalError
+from promptsub.types import Program, ValidatedParams
+
+
+SubstituteFunction = Callable[[ValidatedParams], str]
+
+# Keep the generated expressions far from the compiler's nesting limits
+_MAX_INLINE_DEPTH = 32
+_MAX_INLINE_OPTIONS = 16
+
+# Kinds of the result pieces. A literal piece holds the text itself, an
+# expression piece holds Python source code.
+_LITERAL = 0
+_EXPRESSION = 1
+
+Piece = tuple[int, str]
+
+
+def generate(programs: list[Program]) -> SubstituteFunction:
+    generator = _Generator()
+    lines = ["def substitute(params):", "    get = params.get"]
+
+    for program in programs:
+        conditions, pieces = generator.branch(program, depth=0)
+        result = _join_pieces(pieces)
+        if len(pieces) == 1 and pieces[0][0] == _EXPRESSION:
+            # Values may be str subclasses, the result is always a str
+            result = "''.join((%s,))" % result
+
+        if not conditions:
+            # All the next alternatives are unreachable
+            lines.append(f"    return {result}")
+            break
+
+        lines.append(f"    if {' and '.join(conditions)}:")
+        lines.append(f"        return {result}")
+
+    else:
+        lines.append("    return ''")
+
+    code = compile("\n".join(lines), "<promptsub template>", "exec")
+    exec(code, generator.namespace)
+    return generator.namespace["substitute"]
+
+
+class _Generator:
+
+    def __init__(self):
+        self.namespace = {"__builtins__": {}}
+        self._value_numbers = count()
+        self._template_numbers = count()
+
+    def expression(self, programs: list[Program], depth: int) -> Piece:
+        """
+        The alternatives become a chain of conditional expressions:
+        `result_1 if conditions_1 else result_2 if conditions_2 else ''`
+        """
+        branches = []
+
+        for program in programs:
+            conditions, pieces = self.branch(program, depth)
+
+            if not conditions:
+                if not branches and len(pieces) == 1:
+                    # May be a constant, which is then folded
+                    return pieces[0]
+
+                # All the next alternatives are unreachable
+                branches.append(_join_pieces(pieces))
+                break
+
+            result = _join_pieces(pieces)
+            branches.append(f"{result} if {' and '.join(conditions)} else")
+
+        else:
+            branches.append("''")
+
+        return _EXPRESSION, "(%s)" % " ".join(branches)
+
+    def branch(self,
+               program: Program,
+               depth: int) -> tuple[list[str], list[Piece]]:
+        """
+        Return the conditions of an alternative and the pieces of its
+        result, where the adjacent literals are merged.
+        """
+        conditions = []
+        pieces = []
+
+        for instruction in program:
+            opcode = instruction[0]
+
+            if opcode == op.LITERAL:
+                pieces.append((_LITERAL, instruction[1]))
+
+            elif opcode == op.VAR:
+                value_name = "v%d" % next(self._value_numbers)
+                key = instruction[1]
+                conditions.append(f"({value_name} := get({key!r}))")
+                pieces.append((_EXPRESSION, value_name))
+
+            elif opcode == op.MUTE:
+                conditions.append(f"get({instruction[1]!r})")
+
+            elif opcode == op.EQ:
+                _, key, required_value, muted = instruction
+                conditions.append(f"get({key!r}) == {required_value!r}")
+                if not muted:
+                    pieces.append((_LITERAL, required_value))
+
+            elif opcode == op.TEMPLATE:
+                pieces.append(self._template(instruction[1], depth))
+
+            else:
+                err_message = "Wrong opcode: %s"
+                raise InternalError(err_message % opcode)
+
+        return conditions, _merge_literals(pieces)
+
+    def _template(self, template, depth: int) -> Piece:
+        programs = template.programs
+        if depth < _MAX_INLINE_DEPTH and len(programs) <= _MAX_INLINE_OPTIONS:
+            return self.expression(programs, depth + 1)
+
+        function_name = "t%d" % next(self._template_numbers)
+        self.namespace[function_name] = template.substitute
+        return _EXPRESSION, f"{function_name}(params)"
+
+
+def _merge_literals(pieces: list[Piece]) -> list[Piece]:
+    merged = []
+    literal_parts = []
+
+    for kind, piece in pieces:
+        if kind == _LITERAL:
+            literal_parts.append(piece)
+            continue
+
+        if literal_parts:
+            merged.append((_LITERAL, "".join(literal_parts)))
+            literal_parts.clear()
+        merged.append((kind, piece))
+
+    if literal_parts:
+        merged.append((_LITERAL, "".join(literal_parts)))
+    return merged
+
+
+def _join_pieces(pieces: list[Piece]) -> str:
+    if not pieces:
+        return "''"
+
+    sources = [
+        repr(piece) if kind == _LITERAL else piece
+        for kind, piece in pieces
+    ]
+    if len(sources) == 1:
+        return sources[0]
+    return "''.join((%s))" % ", ".join(sources)
@@ -0,0 +1,118 @@
+"""
+Finds the components of a Prompt text at all the nesting levels in a
+single pass, without creating them.
+
+The result is a list of spans `(kind, start_index, end_index, next_span)`,
+which are later turned into Variables, nested Templates and alternatives.
+The spans are ordered by their start index, so the spans inside a nested
+Template immediately follow its own span. `next_span` is the position of
+the first span after the component (and everything inside it) in the
+list, which allows a Template to skip over the contents of the nested
+ones.
+"""
+import re
+
+from promptsub import special_chatacters as sc
+from promptsub.errors import PromptSyntaxError, SyntaxErrorDetails
+from promptsub.types import Span
+
+
+# Kinds of spans
+VARIABLE = 1
+TEMPLATE = 2
+SEPARATOR = 3
+
+_SPECIAL_RE = re.compile("[%s]" % re.escape("".join(sorted(sc.SPECIAL))))
+
+# Action codes of the special characters
+_TEMPLATE_OPENING = 1
+_TEMPLATE_CLOSING = 2
+_TEMPLATE_SEPARATOR = 3
+_VARIABLE_OPENING = 4
+_VARIABLE_CLOSING = 5
+
+
+def _build_action_table() -> bytes:
+    """
+    Map the code point of every ASCII character to its action code, which
+    is 0 for all the non-special characters.
+    """
+    table = bytearray(128)
+    table[ord(sc.TEMPLATE.OPENING)] = _TEMPLATE_OPENING
+    table[ord(sc.TEMPLATE.CLOSING)] = _TEMPLATE_CLOSING
+    table[ord(sc.TEMPLATE.SEPARATOR)] = _TEMPLATE_SEPARATOR
+    table[ord(sc.VARIABLE.OPENING)] = _VARIABLE_OPENING
+    table[ord(sc.VARIABLE.CLOSING)] = _VARIABLE_CLOSING
+    return bytes(table)
+
+
+_ACTIONS = _build_action_table()
+
+
+def scan(text: str) -> list[Span]:
+    """
+    Only the special characters are visited one by one, the plain text
+    between them is never copied.
+    """
+    spans = []
+    # Start indices and span positions of the Templates not closed yet
+    open_templates = []
+    variable_start = None
+
+    for special in _SPECIAL_RE.finditer(text):
+        i = special.start()
+        char = special.group()
+        action = _ACTIONS[ord(char)]
+
+        if variable_start is not None:
+            if action != _VARIABLE_CLOSING:
+                """
+                sc.TEMPLATE.OPENING, Variable
+                sc.TEMPLATE.CLOSING, Variable
+                sc.TEMPLATE.SEPARATOR, Variable
+                sc.VARIABLE.OPENING, Variable
+                """
+                _raise_wrong_position(text, i)
+            spans.append((VARIABLE, variable_start, i + 1, len(spans) + 1))
+            variable_start = None
+
+        elif action == _VARIABLE_OPENING:
+            variable_start = i
+
+        elif action == _TEMPLATE_OPENING:
+            open_templates.append((i, len(spans)))
+            # Replaced when the Template is closed
+            spans.append(None)
+
+        elif action == _TEMPLATE_CLOSING and open_templates:
+            template_start, position = open_templates.pop()
+            spans[position] = (TEMPLATE, template_start, i + 1, len(spans))
+
+        elif action == _TEMPLATE_SEPARATOR:
+            spans.append((SEPARATOR, i, i + 1, len(spans) + 1))
+
+        else:
+            """
+            sc.TEMPLATE.CLOSING, None
+            sc.VARIABLE.CLOSING, None
+            """
+            _raise_wrong_position(text, i)
+
+    if open_templates:
+        err_details = SyntaxErrorDetails(
+            text=text,
+            offset=open_templates[0][0] + 1
+        )
+        raise PromptSyntaxError("Template not closed", err_details)
+
+    if variable_start is not None:
+        err_details = SyntaxErrorDetails(text=text, offset=variable_start + 1)
+        raise PromptSyntaxError("Variable not closed", err_details)
+
+    return spans
+
+
+def _raise_wrong_position(text: str, index: int) -> None:
+    err_message = f"Wrong special character '%s' position"
+    err_details = SyntaxErrorDetails(text=text, offset=index + 1)
+    raise PromptSyntaxError(err_message % text[index], err_details)
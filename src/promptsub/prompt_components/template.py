@@ -1,18 +1,21 @@
 from __future__ import annotations
-from typing import Optional
+from functools import cached_property
 
-from attrs import define
+from attrs import define, field
 
-from promptsub import special_chatacters as sc
+from promptsub import opcodes as op
+from promptsub.prompt_components import codegen, scanner
 from promptsub.prompt_components.base import non_init, PromptComponent
 from promptsub.prompt_components.variable import Variable
-from promptsub.errors import (
-    InternalError,
-    PromptSyntaxError,
-    VariableError,
-    SyntaxErrorDetails,
+from promptsub.errors import PromptSyntaxError
+from promptsub.types import (
+    Instruction,
+    PositionedComponent,
+    Program,
+    RequiredAndOptionalVariables,
+    Span,
+    ValidatedParams,
 )
-from promptsub.types import ValidatedParams, RequiredAndOptionalVariables
 
 
 @define(kw_only=True)
@@ -20,39 +23,62 @@ class Template(PromptComponent):
 
     input_text: str = None
 
-    _components: list[PromptComponent] = non_init(factory=list)
+    # Closed Variables by their content, shared by all the Templates of
+    # a Prompt, so that repeated Variables are parsed and stored once
+    _variable_cache: dict[str, Variable] = field(
+        factory=dict,
+        repr=False,
+        eq=False
+    )
+
+    # Components with their start and end indices in `input_text`
+    _components: list[PositionedComponent] = non_init(factory=list)
     _templates: list[Template] = non_init(factory=list, repr=False)
     _variables: list[Variable] = non_init(factory=list, repr=False)
 
-    _alternative: Template = non_init(default=None)
+    # The next options after separators. They only hold their own
+    # components and are never substituted on their own.
+    _alternatives: list[Template] = non_init(factory=list)
+
+    # Compiled programs of this Template and all its alternatives.
+    # Always assigned after parsing, so no factory is needed.
+    _programs: list[Program] = non_init(default=None, repr=False)
 
     def __attrs_post_init__(self):
         if self.input_text is not None:
-            self._parse_and_validate()
+            spans = scanner.scan(self.input_text)
+            self._parse_and_validate(self.input_text, spans, 0, len(spans))
 
     def substitute(self, params: ValidatedParams) -> str:
         """
-        1. Check if all the top-level Variables are present in params;
-        2. If not, go to `self.alternative` and start again;
-        3. If yes, substitute all Templates and Variables from right to left.
+        Return the result of the first alternative, all Variables of which
+        match the params, or an empty string.
         """
-        try:
-            variable_substitutions = [
-                variable.substitute(params) for variable in self._variables
-            ]
-        except VariableError:
-            if self._alternative:
-                return self._alternative.substitute(params)
-            return ""
+        return self.substitute_function(params)
 
-        return self._substitute_all_components(params, variable_substitutions)
+    @cached_property
+    def substitute_function(self) -> codegen.SubstituteFunction:
+        """
+        Python function generated from the programs of all alternatives.
+        It is created on the first use, so that the alternatives and the
+        nested Templates, which are inlined into their parents, don't
+        spend time on it.
+        """
+        return codegen.generate(self._programs)
 
     @property
-    def variable_keys(self) -> list[RequiredAndOptionalVariables]:
+    def programs(self) -> list[Program]:
+        return self._programs
+
+    def as_instruction(self) -> Instruction:
+        return op.TEMPLATE, self
+
+    @cached_property
+    def variable_keys(self) -> tuple[RequiredAndOptionalVariables, ...]:
         """
         Get the names (keys) of all Variables used in a Template.
 
-        This creates a list of `RequiredAndOptionalVariables`, where each
+        This creates a tuple of `RequiredAndOptionalVariables`, where each
         instance represents an alternative (option divided by separator "|")
         in the current level of Template.
 
@@ -64,149 +90,198 @@ class Template(PromptComponent):
         As a result we get NamedTuples in which `required` variables come
         from the single top level and `optional` variables from all the
         nested levels.
+
+        The nested Templates are processed from the deepest ones up
+        without recursion, so that deep nesting doesn't hit the recursion
+        limit. The result is computed once, since a Template doesn't
+        change after parsing. It is a tuple, because parsed Templates are
+        shared by all the Prompts with the same text.
         """
-        required = {variable.key for variable in self._variables}
+        templates = [self]
+        for template in templates:
+            for option in (template, *template._alternatives):
+                templates.extend(option._templates)
+
+        # Variable keys of the already processed Templates by their ids
+        all_keys = {}
+        for template in reversed(templates):
+            all_keys[id(template)] = tuple(
+                option._get_option_variable_keys(all_keys)
+                for option in (template, *template._alternatives)
+            )
+        return all_keys[id(self)]
+
+    def _get_option_variable_keys(
+            self,
+            all_keys: dict[int, tuple[RequiredAndOptionalVariables, ...]]
+    ) -> RequiredAndOptionalVariables:
+        required = frozenset(variable.key for variable in self._variables)
         optional = set()
 
         for child_template in self._templates:
-            for child_variable_keys in child_template.variable_keys:
+            for child_variable_keys in all_keys[id(child_template)]:
                 optional.update(child_variable_keys.required)
                 optional.update(child_variable_keys.optional)
 
-        result = [RequiredAndOptionalVariables(required, optional)]
-        if self._alternative:
-            result += self._alternative.variable_keys
-        return result
+        return RequiredAndOptionalVariables(required, frozenset(optional))
 
-    def _substitute_all_components(self,
-                                   params: ValidatedParams,
-                                   variable_substitutions: list[str]) -> str:
+    def _compile(self) -> Program:
+        """
+        Turn the parsed components of the current alternative into a flat
+        list of instructions (see `promptsub.opcodes`). The text between
+        the components is sliced here once, so that `substitute` only has
+        to join the ready pieces.
+
+        Instructions that don't produce any text (muted Variables) are
+        moved to the beginning of the program: they fail fast, and the
+        literals around them are merged together. Empty literals are
+        dropped.
+        """
         text = self.input_text
+        checks = []
+        program = []
+        literal_parts = []
+        literal_start = 0
+
+        for component, start_index, end_index in self._components:
+            literal_parts.append(text[literal_start:start_index])
+            literal_start = end_index
+
+            instruction = component.as_instruction()
+            if _is_check(instruction):
+                checks.append(instruction)
+                continue
 
-        for component in reversed(self._components):
-            match component:
-                case Template():
-                    component_text = component.substitute(params)
-                case Variable():
-                    component_text = variable_substitutions.pop()
-                case _:
-                    err_message = "Wrong component type: %s"
-                    raise InternalError(err_message % type(component))
-            text = "".join((
-                text[:component.start_index],
-                component_text,
-                text[component.end_index:],
-            ))
+            _add_literal(program, literal_parts)
+            program.append(instruction)
+
+        literal_parts.append(text[literal_start:])
+        _add_literal(program, literal_parts)
 
-        return text
+        checks.extend(program)
+        return checks
 
-    def _before_close(self) -> None:
-        self.input_text = "".join(self._input_characters)
-        self._parse_and_validate()
+    def _set_programs(self) -> None:
+        self._programs = [
+            option._compile() for option in (self, *self._alternatives)
+        ]
 
-    def _parse_and_validate(self) -> None:
+    def _parse_and_validate(self,
+                            text: str,
+                            spans: list[Span],
+                            position: int,
+                            stop: int,
+                            offset: int = 0) -> None:
         """
-        Pass the whole Template one level at a time. After running this
-        method, our `_components` and `_alternative` attributes obtain
-        their final values (can still be an empty list and None though).
-        Depending on what we encounter, there are the 3 main logic flows:
+        Build the whole Template from the spans found by `scanner.scan`.
+        The spans of this Template are `spans[position:stop]`, and their
+        indices are shifted by `offset` relative to the `text`. After
+        running this method, our `_components` and `_alternatives`
+        attributes obtain their final values (can still be empty lists
+        though).
+
+        Depending on the kind of a span, there are the 3 main logic flows:
 
         1. A Variable.
-        We instantiate it and then append the next characters to it until
-        it's closed. A Variable checks every character in real time and
-        may raise a `PromptsubSyntaxError`.
-        Template should know as little as possible about the internal
-        workings of Variable, since they may change independently.
-        Hovever, all the scope defining special characters, except the
-        `sc.VARIABLE.CLOSING`, are not allowed to be used in Variable.
-        When a Variable is closed, we save it to our `_components`.
+        We instantiate it and close it, so that it receives the text
+        between the brackets, checks it and may raise a
+        `PromptsubSyntaxError`. Template should know as little as possible
+        about the internal workings of Variable, since they may change
+        independently. When a Variable is closed, we save it to our
+        `_components`. If a Variable with the same text was already met
+        anywhere in the Prompt, that instance is reused.
 
         2. Another nested Template
-        Instantiate it and then append to it all the next characters
-        (special or not) until it's closed - no validation is done yet.
-        When a Template is closed, it runs its own `_parse_and_validate()`
-        method. After that we save it to our `_components`.
+        Instantiate it, save it to our `_components` and continue with
+        the spans that follow, up to its `next_span`, building the nested
+        Template. The state of the current level is kept on an explicit
+        stack instead of recursing, so that deeply nested templates don't
+        hit the recursion limit. When the nested Template is built, we
+        continue from its `next_span`.
 
         3. A Separator
-        At this point we stop the current Template's text and create a
-        new Template with its `input_text` being the tail after the
-        Separator. This new Template is parsed and after that saved to
-        our `_alternative` attribute.
+        At this point we finish the current option's text and create a
+        new Template for the next option, which is saved to our
+        `_alternatives`. The next components go to that Template.
         """
+        template = option = self
+        option_start = 0
+        stack = []
+
+        while True:
+            if position == stop:
+                option._set_option_text(text[option_start:])
+                template._set_programs()
+                if not stack:
+                    return
+                template, option, option_start, text, offset, stop = (
+                    stack.pop()
+                )
+                continue
 
-        text = self.input_text
-        current_component: Optional[PromptComponent] = None
-        nested_template_stack = []
-
-        characters_to_check = sc.TEMPLATE + sc.VARIABLE
+            kind, start_index, end_index, next_position = spans[position]
+            start_index -= offset
+            end_index -= offset
 
-        def close_and_save_component(current_index: int,
-                                     save_destination: list[PromptComponent]):
-            nonlocal current_component
+            if kind == scanner.SEPARATOR:
+                option._set_option_text(text[option_start:start_index])
+                option = Template(variable_cache=self._variable_cache)
+                template._alternatives.append(option)
+                option_start = end_index
+                position = next_position
+                continue
 
-            current_component.close(end_index=current_index + 1)
-            self._components.append(current_component)
-            save_destination.append(current_component)
-            current_component = None
+            content = text[start_index + 1:end_index - 1]
 
-        for i, char in enumerate(text):
+            if kind == scanner.TEMPLATE:
+                component = Template(variable_cache=self._variable_cache)
+                option._templates.append(component)
+            else:
+                component = self._get_variable(content)
+                option._variables.append(component)
 
-            if char not in characters_to_check:
-                if current_component is not None:
-                    current_component.append(char)
-                continue
+            option._components.append((
+                component,
+                start_index - option_start,
+                end_index - option_start,
+            ))
 
-            match char, current_component:
-                case [sc.TEMPLATE.OPENING, None]:
-                    current_component = Template(start_index=i)
-
-                case [sc.TEMPLATE.OPENING, Template()]:
-                    nested_template_stack.append(...)
-                    current_component.append(char)
-
-                case [sc.TEMPLATE.CLOSING, Template()]:
-                    if nested_template_stack:
-                        nested_template_stack.pop()
-                        current_component.append(char)
-                        continue
-                    close_and_save_component(i, self._templates)
-
-                case [_, Template()]:
-                    current_component.append(char)
-
-                case [sc.VARIABLE.OPENING, None]:
-                    current_component = Variable(start_index=i)
-
-                case [sc.VARIABLE.CLOSING, Variable()]:
-                    close_and_save_component(i, self._variables)
-
-                case [sc.TEMPLATE.SEPARATOR, None]:
-                    alt_text = text[i + 1:]
-                    self._alternative = Template(input_text=alt_text)
-                    self.input_text = text[:i]
-                    break
-
-                case _:
-                    """
-                    sc.TEMPLATE.OPENING, Variable()
-                    sc.TEMPLATE.CLOSING, Variable()
-                    sc.TEMPLATE.SEPARATOR, Variable()
-                    sc.VARIABLE.OPENING, Variable()
-                    sc.TEMPLATE.CLOSING, None
-                    sc.VARIABLE.CLOSING, None
-                    """
-                    err_message = f"Wrong special character '%s' position"
-                    err_details = SyntaxErrorDetails(text=text, offset=i + 1)
-                    raise PromptSyntaxError(err_message % char, err_details)
-
-        # Check after the iteration to deal with repeated separators
-        if self.input_text == "":
+            if kind == scanner.TEMPLATE:
+                stack.append(
+                    (template, option, option_start, text, offset, stop)
+                )
+                template = option = component
+                option_start = 0
+                text = content
+                offset += start_index + 1
+                stop = next_position
+                position += 1
+            else:
+                position = next_position
+
+    def _set_option_text(self, text: str) -> None:
+        # Checked for every option to deal with repeated separators
+        if text == "":
             raise PromptSyntaxError("A template can not be empty")
+        self.input_text = text
+
+    def _get_variable(self, content: str) -> Variable:
+        variable = self._variable_cache.get(content)
+        if variable is None:
+            variable = Variable()
+            variable.close(content)
+            self._variable_cache[content] = variable
+        return variable
+
+
+def _is_check(instruction: Instruction) -> bool:
+    opcode = instruction[0]
+    return opcode == op.MUTE or (opcode == op.EQ and instruction[3])
+
+
+def _add_literal(program: Program, literal_parts: list[str]) -> None:
+    literal = "".join(literal_parts)
+    literal_parts.clear()
+    if literal:
+        program.append((op.LITERAL, literal))
 
-        if current_component is not None:
-            err_message = "%s not closed" % type(current_component).__name__
-            err_details = SyntaxErrorDetails(
-                text=text,
-                offset=current_component.start_index + 1
-            )
-            raise PromptSyntaxError(err_message, err_details)
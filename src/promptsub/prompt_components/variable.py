@@ -1,131 +1,132 @@
+import re
+
 from attrs import define
 
+from promptsub import opcodes as op
 from promptsub import special_chatacters as sc
 from promptsub.prompt_components.base import non_init, PromptComponent
 from promptsub.errors import (
     InternalError,
     PromptSyntaxError,
-    VariableError,
     SyntaxErrorDetails,
 )
-from promptsub.types import ValidatedParams
+from promptsub.types import Instruction
+
+
+_SAFE_CHARS = frozenset(sc.VARIABLE_NAME_SAFE)
+
+# {var}, {~var}, {var=value} and {~var=value}
+_VARIABLE_RE = re.compile(
+    "(%s)?([%s]+)(?:%s(.+))?" % (
+        re.escape(sc.VARIABLE_OPTIONS.MUTE),
+        re.escape(sc.VARIABLE_NAME_SAFE),
+        re.escape(sc.VARIABLE_OPTIONS.EQ),
+    ),
+    re.DOTALL
+)
 
 
 @define(kw_only=True)
 class Variable(PromptComponent):
 
+    _closed: bool = non_init(default=False)
     _muted: bool = non_init(default=False)
 
     _key: str = non_init(default=None)
     _required_value: str = non_init(default=None)
 
-    _key_characters: list[str] = non_init(factory=list, repr=False)
-    _required_value_characters: list[str] = non_init(factory=list, repr=False)
-
-    def __attrs_post_init__(self):
-        """
-        Start appending to `_key_characters` first.
-        See `self.append` for more info.
-        """
-        self._input_characters = self._key_characters
-
-    def substitute(self, params: ValidatedParams) -> str:
-        if self.end_index is None:
-            err_message = "End index must be set before substitution"
+    def as_instruction(self) -> Instruction:
+        if not self.closed:
+            err_message = "Variable must be closed before compilation"
             raise InternalError(err_message)
 
-        result = params.get(self._key, "")
-        if result == "":
-            raise VariableError
-
-        if self._required_value and result != self._required_value:
-            raise VariableError
+        if self._required_value:
+            return op.EQ, self._key, self._required_value, self._muted
 
         if self._muted:
-            result = ""
+            return op.MUTE, self._key
 
-        return result
+        return op.VAR, self._key
 
-    def append(self, char: str):
+    def close(self, content: str) -> None:
         """
-        We are appending to one of the two destination arrays:
-        `_key_characters` or `_required_value_characters`.
+        Called by the parent Template with the text between the opening
+        and the closing characters of the Variable.
 
-        When appending to `_key_characters` we check if the
-        char is among those that set options for Variable and
-        whether it's allowed to be used in a Variable key.
+        The content consists of a key and an optional required value after
+        the first `sc.VARIABLE_OPTIONS.EQ`. The key may start with the
+        `sc.VARIABLE_OPTIONS.MUTE`.
         """
+        if self._closed:
+            err_message = "Variable can only be closed once"
+            raise InternalError(err_message)
 
-        if self._input_characters is self._required_value_characters:
-            super().append(char)
-
-        elif char in sc.VARIABLE_OPTIONS:
-            self._process_option(char)
+        variable_match = _VARIABLE_RE.fullmatch(content)
+        if variable_match is None:
+            self._raise_syntax_error(content)
 
-        elif char not in sc.VARIABLE_NAME_SAFE:
-            err_message = "Char %s not allowed in variable key"
-            self._raise_detailed_syntax_error(err_message % char, char)
+        mute, self._key, self._required_value = variable_match.groups()
+        self._muted = mute is not None
+        self._closed = True
 
-        else:
-            super().append(char)
+    @property
+    def closed(self) -> bool:
+        return self._closed
 
     @property
     def key(self) -> str | None:
         return self._key
 
-    def _before_close(self) -> None:
-        # Order of calls matters
-        self._set_required_value()
-        self._set_key()
+    def _raise_syntax_error(self, content: str) -> None:
+        """
+        Find out what exactly is wrong with the content of a Variable.
+        """
+        key, eq, required_value = content.partition(sc.VARIABLE_OPTIONS.EQ)
+
+        if key.startswith(sc.VARIABLE_OPTIONS.MUTE):
+            self._muted = True
+            key = key[1:]
 
-    def _set_key(self) -> None:
-        if not self._key_characters:
+        # Order of checks matters
+        self._check_key_characters(key)
+
+        if eq and not required_value:
+            err_message = "Required value can not be empty"
+            self._raise_detailed_syntax_error(err_message, key)
+
+        if not key:
             err_message = "Variable key can not be empty"
             raise PromptSyntaxError(err_message)
 
-        self._key = "".join(self._key_characters)
-        self._key_characters = []
-
-    def _set_required_value(self) -> None:
-        if not self._required_value_characters:
-            if self._input_characters is self._required_value_characters:
-                err_message = "Required value can not be empty"
-                self._raise_detailed_syntax_error(err_message)
-            return
-
-        self._required_value = "".join(self._required_value_characters)
-        self._required_value_characters = []
-
-    def _process_option(self, char: str) -> None:
-        match char:
-            case sc.VARIABLE_OPTIONS.MUTE:
-                self._mute()
-            case sc.VARIABLE_OPTIONS.EQ:
-                # Subsequent chars will be appended to another array
-                self._input_characters = self._required_value_characters
-
-    def _mute(self) -> None:
-        if len(self._input_characters) == 0 and not self._muted:
-            self._muted = True
-            return
+        err_message = "Variable %s is not valid" % content
+        raise InternalError(err_message)
 
-        err_message = "A mute symbol is only allowed in the beginning"
-        self._raise_detailed_syntax_error(
-            err_message,
-            sc.VARIABLE_OPTIONS.MUTE
-        )
+    def _check_key_characters(self, key: str) -> None:
+        for i, char in enumerate(key):
+            if char == sc.VARIABLE_OPTIONS.MUTE:
+                err_message = "A mute symbol is only allowed in the beginning"
+                self._raise_detailed_syntax_error(err_message, key[:i], char)
+
+            if char not in _SAFE_CHARS:
+                err_message = "Char %s not allowed in variable key"
+                self._raise_detailed_syntax_error(
+                    err_message % char,
+                    key[:i],
+                    char
+                )
 
     def _raise_detailed_syntax_error(self,
                                      err_message: str,
+                                     key: str,
                                      character: str = None) -> None:
-        err_detail_characters = [
+        err_detail_text = "".join((
             sc.VARIABLE.OPENING,
             sc.VARIABLE_OPTIONS.MUTE if self._muted else "",
-            *self._key_characters,
+            key,
             character or "",
-        ]
+        ))
         err_details = SyntaxErrorDetails(
-            text="".join(err_detail_characters),
-            offset=len(err_detail_characters)
+            text=err_detail_text,
+            offset=len(err_detail_text)
         )
         raise PromptSyntaxError(err_message, err_details)
@@ -21,5 +21,8 @@ class VariableOptions(NamedTuple):
 TEMPLATE = TemplateBoundaries()
 VARIABLE = VariableBoundaries()
 
+# All the characters that define the scopes of components
+SPECIAL = frozenset(TEMPLATE + VARIABLE)
+
 VARIABLE_NAME_SAFE = ascii_letters + digits + "_"
 VARIABLE_OPTIONS = VariableOptions()
@@ -3,10 +3,20 @@ from typing import NamedTuple, TypeAlias
 InputParams: TypeAlias = dict[str, str | int | float]
 ValidatedParams: TypeAlias = dict[str, str]
 
+Instruction: TypeAlias = tuple
+Span: TypeAlias = tuple[int, int, int, int]
+
+# (component, start_index, end_index)
+PositionedComponent: TypeAlias = tuple
+Program: TypeAlias = list[Instruction]
+
 
 class RequiredAndOptionalVariables(NamedTuple):
-    required: set[str]
-    optional: set[str]
+    required: frozenset[str]
+    optional: frozenset[str]
 
     def __repr__(self) -> str:
-        return f"(required={self.required}, optional={self.optional})"
+        # Same look as the mutable sets
+        required = set(self.required)
+        optional = set(self.optional)
+        return f"(required={required}, optional={optional})"
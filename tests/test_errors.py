@@ -88,6 +88,37 @@ class TestTemplate:
         Prompt(template)
 
 
+class TestErrorPrecedence:
+    """
+    The special characters of the whole text are checked before the
+    contents of Variables and the emptiness of Templates.
+    """
+
+    @pytest.mark.parametrize("template, message, offset", (
+        ("{a\t]", "Wrong special character ']' position", 4),
+        ("{a!} ]", "Wrong special character ']' position", 6),
+        ("{} ]", "Wrong special character ']' position", 4),
+        ("[]  ||{~a=x} ]", "Wrong special character ']' position", 14),
+        ("{a!} [", "Template not closed", 6),
+        ("{a!", "Variable not closed", 1),
+    ))
+    def test_special_characters_first(self, template, message, offset):
+        with pytest.raises(PromptSyntaxError) as exc_info:
+            Prompt(template)
+        assert exc_info.value.msg == message
+        assert exc_info.value.text == template
+        assert exc_info.value.offset == offset
+
+    @pytest.mark.parametrize("template, message", (
+        ("{a!} []", "Char ! not allowed in variable key"),
+        ("[] {a!}", "A template can not be empty"),
+    ))
+    def test_components_in_order(self, template, message):
+        with pytest.raises(PromptSyntaxError) as exc_info:
+            Prompt(template)
+        assert exc_info.value.msg == message
+
+
 class TestParams:
 
     @raises(ParametersTypeError)
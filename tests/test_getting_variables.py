@@ -55,3 +55,8 @@ class TestGettingVariables:
             RequiredAndOptionalVariables({"var_1"}, set()),
         ]
         assert Prompt(template).variables == output
+
+    def test_not_shared_between_prompts(self):
+        template = "Hi {a} | {b}"
+        Prompt(template).variables.pop()
+        assert len(Prompt(template).variables) == 2
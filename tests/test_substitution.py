@@ -1,3 +1,4 @@
+from enum import Enum
 from string import punctuation
 
 import pytest
@@ -13,21 +14,22 @@ def generate_fake_params(n: int) -> tuple[dict, dict, dict]:
     even: {"var_2": "value_2", "var_4": "value_4", ...}
     odd:  {"var_1": "value_1", "var_3": "value_3", ...}
     """
-    odd = {}
-    even = {}
-    for i in range(1, 1 + n):
-        kw_pair = {f"var_{i}": f"value_{i}"}
-        if i % 2:
-            odd.update(kw_pair)
-        else:
-            even.update(kw_pair)
-    all_ = odd | even
+    numbers = range(1, 1 + n)
+    keys = list(map("var_%d".__mod__, numbers))
+    values = list(map("value_%d".__mod__, numbers))
+    all_ = dict(zip(keys, values))
+    even = dict(zip(keys[1::2], values[1::2]))
+    odd = dict(zip(keys[::2], values[::2]))
     return all_, even, odd
 
 
 params_all, params_even, params_odd = generate_fake_params(10)
 
 
+class Genre(str, Enum):
+    COMEDY = "comedy"
+
+
 class TestVariable:
 
     @pytest.mark.parametrize("template, params, output", (
@@ -56,6 +58,19 @@ class TestVariable:
             output = "Why not %s" % value
             assert Prompt(template).substitute(params) == output
 
+    @pytest.mark.parametrize("template, output", (
+            ("{genre}", "comedy"),
+            ("[{genre}]", "comedy"),
+            ("Recommend a {genre} movie", "Recommend a comedy movie"),
+            ("{genre} movie [{x}]", "comedy movie "),
+            ("Watch a {genre} movie [now]", "Watch a comedy movie now"),
+    ))
+    def test_str_subclass_value(self, template, output):
+        params = {"genre": Genre.COMEDY}
+        result = Prompt(template).substitute(params, False)
+        assert result == output
+        assert type(result) is str
+
     @pytest.mark.parametrize("reduce_whitespaces, output", (
             (True, "did someone say whitespaces ?"),
             (False, "  did someone \t say \n whitespaces \r?"),
@@ -137,6 +152,15 @@ class TestTemplate:
         output = "Insane? - Yes, but should still be ok...."
         assert Prompt(template).substitute({}) == output
 
+    def test_very_deep_nesting(self):
+        # Deeper than the recursion limit
+        template = "[{var} " * 3000 + "end" + "]" * 3000
+        output = "value " * 3000 + "end"
+        prompt = Prompt(template)
+        assert prompt.substitute({"var": "value"}) == output
+        assert prompt.substitute({}) == ""
+        assert prompt.variables[0].optional == {"var"}
+
     @pytest.mark.parametrize("params, output", (
             (params_all, "Only if value_1 and value_2 are known"),
             (params_even, ""),
@@ -158,6 +182,10 @@ class TestSeparator:
         template = "Blue if {var_1} | Red if {var_2}"
         assert Prompt(template).substitute(params) == output
 
+    def test_many_alternatives(self):
+        template = "{var} | " * 5000 + "Last"
+        assert Prompt(template).substitute({}) == "Last"
+
     def test_unreachable(self):
         template = "Constant | this is unreachable {var}"
         assert Prompt(template).substitute({"var": "value"}) == "Constant"
@@ -183,3 +211,25 @@ class TestMisc:
             postprocess_whitespace_reduction=False
         )
         assert result == output
+
+    def test_parsed_templates_not_mixed(self):
+        params = {"var": "value"}
+        # The second time the parsed Templates come from the cache
+        for _ in range(2):
+            assert Prompt("First {var}").substitute(params) == "First value"
+            assert Prompt("Second {var}").substitute(params) == "Second value"
+        Prompt.cache_clear()
+        assert Prompt("First {var}").substitute(params) == "First value"
+
+    def test_python_syntax_in_text(self):
+        value = "'\"\\"
+        template = "'''\\n {var=%s} | \\\\ {~var} ''.join(())" % value
+        output = "'''\\n " + value
+        assert Prompt(template).substitute({"var": value}) == output
+        output = "\\\\ ''.join(())"
+        assert Prompt(template).substitute({"var": "x"}) == output
+
+    def test_params_not_changed(self):
+        params = {"var": 1}
+        assert Prompt("{var}").substitute(params) == "1"
+        assert params == {"var": 1}